@@ -0,0 +1,112 @@
+"""
+Response Cache
+
+Two-tier cache for the read-heavy GET endpoints:
+
+- a short-lived in-process TTLCache (per worker)
+- an optional Redis near-cache shared by all workers, enabled when
+  REDIS_URL is set
+
+Entries hold already-serialized JSON bodies, so a hit skips both the
+MongoDB query and serialization. Keys are tuples whose first element is a
+namespace (usually the collection name), so writes can drop everything
+for that namespace at once.
+"""
+
+import os
+from typing import Hashable, Optional
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+load_dotenv()
+
+CACHE_TTL_SECONDS = 5
+REDIS_TTL_SECONDS = 60
+# keep a slow or unreachable Redis from stalling requests; misses fall back to MongoDB
+REDIS_TIMEOUT_SECONDS = 0.25
+
+_cache = TTLCache(maxsize=256, ttl=CACHE_TTL_SECONDS)
+
+_redis = None
+
+redis_url = os.getenv("REDIS_URL")
+
+if redis_url:
+    _redis = Redis.from_url(
+        redis_url,
+        socket_connect_timeout=REDIS_TIMEOUT_SECONDS,
+        socket_timeout=REDIS_TIMEOUT_SECONDS,
+    )
+
+def _redis_key(key: tuple) -> str:
+    return "cache:" + ":".join(str(part) for part in key)
+
+def _redis_index_key(namespace: str) -> str:
+    # set of the Redis keys stored for a namespace, so invalidation never scans
+    return "cache-keys:" + namespace
+
+async def get_cached(key: Hashable) -> Optional[bytes]:
+    """Return the cached body for key, or None on a miss"""
+    body = _cache.get(key)
+    if body is None and _redis is not None:
+        try:
+            body = await _redis.get(_redis_key(key))
+        except RedisError:
+            return None
+        if body is not None:
+            _cache[key] = body
+    return body
+
+async def set_cached(key: Hashable, body: bytes, indexed: bool = False):
+    """Store a serialized body under key
+
+    Pass indexed=True for entries that invalidate(namespace) must be able to
+    drop; only those are tracked in the namespace's Redis key set.
+    """
+    _cache[key] = body
+    if _redis is not None:
+        try:
+            redis_key = _redis_key(key)
+            if not indexed:
+                await _redis.set(redis_key, body, ex=REDIS_TTL_SECONDS)
+                return
+            index_key = _redis_index_key(key[0])
+            async with _redis.pipeline(transaction=False) as pipe:
+                pipe.set(redis_key, body, ex=REDIS_TTL_SECONDS)
+                pipe.sadd(index_key, redis_key)
+                pipe.expire(index_key, REDIS_TTL_SECONDS)
+                await pipe.execute()
+        except RedisError:
+            pass
+
+async def invalidate(namespace: str, *parts):
+    """Drop the entry (namespace, *parts), or every entry in namespace if no parts are given"""
+    if parts:
+        _cache.pop((namespace, *parts), None)
+        if _redis is not None:
+            try:
+                redis_key = _redis_key((namespace, *parts))
+                async with _redis.pipeline(transaction=False) as pipe:
+                    pipe.delete(redis_key)
+                    pipe.srem(_redis_index_key(namespace), redis_key)
+                    await pipe.execute()
+            except RedisError:
+                pass
+        return
+
+    for key in [k for k in _cache.keys() if k[0] == namespace]:
+        _cache.pop(key, None)
+    if _redis is not None:
+        try:
+            index_key = _redis_index_key(namespace)
+            keys = await _redis.smembers(index_key)
+            await _redis.delete(index_key, *keys)
+        except RedisError:
+            pass
+
+async def close_cache():
+    """Close the Redis connection pool, if any"""
+    if _redis is not None:
+        await _redis.aclose()
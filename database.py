@@ -5,9 +5,11 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
 from datetime import datetime, timezone
 import os
+import logging
 from dotenv import load_dotenv
 from typing import Union
 from pydantic import BaseModel
@@ -15,41 +17,93 @@ from pydantic import BaseModel
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 _client = None
 db = None
 
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
+# One client per process: it owns the connection pool and is reused by every request.
+# Every worker process has its own pool, so keep the idle minimum low.
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = AsyncIOMotorClient(
+        database_url,
+        maxPoolSize=100,
+        minPoolSize=1,
+        serverSelectionTimeoutMS=2000,
+    )
     db = _client[database_name]
 
+def close_client():
+    """Close the shared client and its connection pool"""
+    if _client is not None:
+        _client.close()
+
+# $currentDate sub-document for bumping updated_at; shared by reference, never mutated
+TOUCH_UPDATED_AT = {"updated_at": True}
+
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
-    # Convert Pydantic model to dict if needed
+    # Convert Pydantic model to dict if needed (models are dumped once, no extra copy)
     if isinstance(data, BaseModel):
         data_dict = data.model_dump()
     else:
         data_dict = data.copy()
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    now = datetime.now(timezone.utc)
+    data_dict['created_at'] = now
+    data_dict['updated_at'] = now
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, sort: list = None, projection: dict = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=limit or None)
+
+async def ensure_indexes():
+    """Create indexes for the hot query keys (idempotent)
+
+    Failures are logged rather than raised so the API still starts, e.g.
+    when Mongo is briefly unreachable or user already holds duplicate
+    emails (dedupe those, then restart to get the unique index).
+    """
+    if db is None:
+        return
+
+    indexes = [("user", "email", {"unique": True})]
+    indexes += [(name, [("created_at", -1)], {}) for name in ("forumpost", "news", "galleryimage", "product")]
+    for collection_name, keys, options in indexes:
+        try:
+            await db[collection_name].create_index(keys, **options)
+        except PyMongoError as e:
+            logger.warning("Could not create index %s on %s: %s", keys, collection_name, e)
+
+async def stream_documents(collection_name: str, filter_dict: dict = None, limit: int = None, sort: list = None, projection: dict = None, batch_size: int = 50):
+    """Yield documents from collection as the cursor fetches them, batch_size at a time"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    cursor = db[collection_name].find(filter_dict or {}, projection, batch_size=batch_size)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    async for doc in cursor:
+        yield doc
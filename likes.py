@@ -0,0 +1,82 @@
+"""
+Like Buffer
+
+Write-behind buffer for like counters. Likes are counted in memory per
+(collection, _id) and flushed to MongoDB about once a second as a single
+bulk_write of aggregated $inc updates per collection, so a viral post costs
+one write per interval instead of one per like.
+
+Buffered likes live only in this worker's memory; they are flushed on
+shutdown, but a crash loses at most one interval's worth.
+"""
+
+import asyncio
+from collections import defaultdict
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from database import db, TOUCH_UPDATED_AT
+
+FLUSH_INTERVAL_SECONDS = 1.0
+
+_pending = defaultdict(int)
+_flush_task = None
+_stop_event = None
+
+def add_like(collection_name: str, _id) -> int:
+    """Buffer one like and return the number of likes pending for the document"""
+    _pending[(collection_name, _id)] += 1
+    return _pending[(collection_name, _id)]
+
+def pending_likes(collection_name: str, _id) -> int:
+    """Likes buffered for the document but not yet written to MongoDB"""
+    return _pending.get((collection_name, _id), 0)
+
+async def flush_likes():
+    """Write all buffered likes with one bulk_write per collection"""
+    global _pending
+    if not _pending or db is None:
+        return
+    batch, _pending = _pending, defaultdict(int)
+
+    by_collection = defaultdict(list)
+    for (collection_name, _id), count in batch.items():
+        by_collection[collection_name].append((_id, count))
+    for collection_name, entries in by_collection.items():
+        ops = [UpdateOne({"_id": _id}, {"$inc": {"likes": count}, "$currentDate": TOUCH_UPDATED_AT}) for _id, count in entries]
+        try:
+            await db[collection_name].bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # unordered: everything except the reported ops was applied, so only retry those
+            for error in e.details.get("writeErrors", []):
+                _id, count = entries[error["index"]]
+                _pending[(collection_name, _id)] += count
+        except PyMongoError:
+            # nothing confirmed written; put the counts back so the next flush retries them
+            for _id, count in entries:
+                _pending[(collection_name, _id)] += count
+
+async def _flush_loop(stop: asyncio.Event):
+    # never cancelled mid-flush: a swapped-out batch only lives in flush_likes' locals
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), FLUSH_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            await flush_likes()
+
+def start_like_flusher():
+    """Start the background flush loop on the running event loop"""
+    global _flush_task, _stop_event
+    if _flush_task is None:
+        _stop_event = asyncio.Event()
+        _flush_task = asyncio.create_task(_flush_loop(_stop_event))
+
+async def stop_like_flusher():
+    """Stop the flush loop, letting an in-flight flush finish, and write whatever is still buffered"""
+    global _flush_task, _stop_event
+    if _flush_task is not None:
+        _stop_event.set()
+        await _flush_task
+        _flush_task = None
+        _stop_event = None
+    await flush_likes()
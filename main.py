@@ -1,12 +1,23 @@
 import os
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends
+import hmac
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Query, Request
+from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timezone
-from bson import ObjectId
+import orjson
+from bson import ObjectId, SON
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 
-from database import db, create_document, get_documents
+from database import db, TOUCH_UPDATED_AT, create_document, get_documents, stream_documents, ensure_indexes, close_client
+from cache import CACHE_TTL_SECONDS, get_cached, set_cached, invalidate, close_cache
+from likes import add_like, pending_likes, start_like_flusher, stop_like_flusher
 from schemas import (
     User, PublicUser,
     ForumPost, ForumComment,
@@ -15,9 +26,42 @@ from schemas import (
     News, NewsComment,
     LikeAction, CommentAction,
     CreatedResponse,
+    ForumPostOut, NewsOut, GalleryImageOut, GalleryImageSummary, ProductOut,
 )
 
-app = FastAPI(title="Manga.de API")
+def dump_json(content) -> bytes:
+    return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MongoJSONResponse(ORJSONResponse):
+    """orjson response that also serializes ObjectId (and other BSON types) via str()."""
+
+    def render(self, content) -> bytes:
+        return dump_json(content)
+
+
+class ORJSONRoute(APIRoute):
+    """Route that parses JSON request bodies with orjson instead of the stdlib json."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def orjson_handler(request: Request) -> Response:
+            if request.headers.get("content-type", "").startswith("application/json"):
+                body = await request.body()
+                if body:
+                    try:
+                        # Starlette's Request.json() returns the cached _json when set
+                        request._json = orjson.loads(body)
+                    except orjson.JSONDecodeError:
+                        pass  # FastAPI re-parses and reports the error as usual
+            return await handler(request)
+
+        return orjson_handler
+
+
+app = FastAPI(title="Manga.de API", default_response_class=MongoJSONResponse)
+app.router.route_class = ORJSONRoute
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,8 +71,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def start_likes():
+    start_like_flusher()
+
+@app.on_event("startup")
+async def build_schemas():
+    # schemas use defer_build; compile the ones the API touches before the first request
+    for model in (User, ForumPost, ForumComment, GalleryImage, Product, Order, News, NewsComment, LikeAction, CommentAction):
+        model.model_rebuild()
+
+@app.on_event("shutdown")
+async def close_database():
+    await stop_like_flusher()
+    close_client()
+    await close_cache()
+
 # Utilities
 
+# Collection handles are created once; db["name"] builds a new Motor wrapper on every call
+def _collection(name: str):
+    return db[name] if db is not None else None
+
+user_coll = _collection("user")
+forumpost_coll = _collection("forumpost")
+news_coll = _collection("news")
+galleryimage_coll = _collection("galleryimage")
+product_coll = _collection("product")
+
+NEWEST_FIRST = [("created_at", -1)]
+# upper bound for ?limit= on list routes; also bounds the number of cache keys per list
+MAX_LIST_LIMIT = 100
+# image_base64 is a full data URL (often 100s of KB); only the detail endpoint returns it
+WITHOUT_IMAGE_DATA = SON([("image_base64", 0)])
+# Fixed projections, built once
+ID_ONLY = SON([("_id", 1)])
+USER_PUBLIC_PROJ = SON([("username", 1), ("bio", 1), ("avatar", 1), ("theme", 1)])
+USER_LOGIN_PROJ = SON([("username", 1), ("email", 1), ("password_hash", 1)])
+WITHOUT_PASSWORD = SON([("password_hash", 0)])
+# never writable through PUT /users/{id}
+PROTECTED_USER_FIELDS = frozenset({"_id", "email", "password_hash"})
+
 def oid(id_str: str) -> ObjectId:
     try:
         return ObjectId(id_str)
@@ -43,12 +130,41 @@ def with_id(doc):
     return doc
 
 
-@app.get("/")
-def root():
-    return {"name": "Manga.de API", "status": "ok"}
+# list routes pick JSON or NDJSON from Accept, so shared caches must key on it
+CACHE_HEADERS = {"Cache-Control": f"public, max-age={CACHE_TTL_SECONDS}", "Vary": "Accept"}
+
+def cached_json(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json", headers=CACHE_HEADERS)
+
+
+NDJSON = "application/x-ndjson"
+
+async def ndjson_lines(docs):
+    async for doc in docs:
+        yield dump_json(with_id(doc)) + b"\n"
+
+
+async def cached_list(request: Request, collection_name: str, limit: int, projection: dict = None) -> Response:
+    # NDJSON clients get the cursor streamed; everyone else gets a (cached) JSON array
+    if NDJSON in request.headers.get("accept", ""):
+        docs = stream_documents(collection_name, {}, limit, NEWEST_FIRST, projection)
+        return StreamingResponse(ndjson_lines(docs), media_type=NDJSON)
+
+    key = (collection_name, limit)
+    body = await get_cached(key)
+    if body is None:
+        docs = await get_documents(collection_name, {}, limit, NEWEST_FIRST, projection)
+        body = dump_json([with_id(d) for d in docs])
+        await set_cached(key, body, indexed=True)
+    return cached_json(body)
 
-@app.get("/test")
-def test_database():
+
+@app.get("/", response_model=None)
+async def root():
+    return MongoJSONResponse({"name": "Manga.de API", "status": "ok"})
+
+@app.get("/test", response_model=None)
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -64,7 +180,7 @@ def test_database():
             response["database_name"] = db.name
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await db.list_collection_names()
                 response["collections"] = collections[:10]
             except Exception as e:
                 response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
@@ -72,9 +188,31 @@ def test_database():
             response["database"] = "⚠️  Available but not initialized"
     except Exception as e:
         response["database"] = f"❌ Error: {str(e)[:50]}"
-    return response
+    return MongoJSONResponse(response)
 
 # ------------- Auth (simple, demo only) -------------
+ph = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
+# verified against when the email is unknown, so both paths cost one KDF run
+_DUMMY_HASH = ph.hash("dummy-password")
+
+async def verify_password(password_hash: str, password: str) -> Tuple[bool, bool]:
+    """Return (valid, needs_rehash) for a stored hash"""
+    # argon2 is CPU-bound; keep it off the event loop
+    try:
+        await run_in_threadpool(ph.verify, password_hash, password)
+    except InvalidHashError:
+        # legacy rows hold the plaintext password; a match is migrated by the caller.
+        # Spend one KDF run anyway so timing doesn't reveal which accounts are legacy.
+        try:
+            await run_in_threadpool(ph.verify, _DUMMY_HASH, password)
+        except VerificationError:
+            pass
+        valid = hmac.compare_digest(password_hash.encode(), password.encode())
+        return valid, valid
+    except VerificationError:
+        return False, False
+    return True, ph.check_needs_rehash(password_hash)
+
 class RegisterPayload(BaseModel):
     username: str
     email: str
@@ -85,126 +223,194 @@ class LoginPayload(BaseModel):
     password: str
 
 @app.post("/auth/register")
-def register(payload: RegisterPayload):
-    # naive: store hash as plain for demo; in real app, hash properly
-    existing = db["user"].find_one({"email": payload.email})
+async def register(payload: RegisterPayload):
+    existing = await user_coll.find_one({"email": payload.email}, ID_ONLY)
     if existing:
         raise HTTPException(400, "Email already registered")
-    user = User(username=payload.username, email=payload.email, password_hash=payload.password)
-    new_id = create_document("user", user)
+    password_hash = await run_in_threadpool(ph.hash, payload.password)
+    user = User(username=payload.username, email=payload.email, password_hash=password_hash)
+    try:
+        new_id = await create_document("user", user)
+    except DuplicateKeyError:
+        # lost a race with a concurrent registration for the same email
+        raise HTTPException(400, "Email already registered")
     return {"id": new_id}
 
 @app.post("/auth/login")
-def login(payload: LoginPayload):
-    user = db["user"].find_one({"email": payload.email, "password_hash": payload.password})
-    if not user:
+async def login(payload: LoginPayload):
+    user = await user_coll.find_one({"email": payload.email}, USER_LOGIN_PROJ)
+    valid, needs_rehash = await verify_password(user["password_hash"] if user else _DUMMY_HASH, payload.password)
+    if not user or not valid:
         raise HTTPException(401, "Invalid credentials")
+    if needs_rehash:
+        password_hash = await run_in_threadpool(ph.hash, payload.password)
+        await user_coll.update_one(
+            {"_id": user["_id"]},
+            {"$set": {"password_hash": password_hash}, "$currentDate": TOUCH_UPDATED_AT},
+        )
     return {"id": str(user["_id"]), "username": user["username"], "email": user["email"]}
 
 # ------------- Profiles -------------
-@app.get("/users/{user_id}")
-def get_profile(user_id: str):
-    user = db["user"].find_one({"_id": oid(user_id)})
-    if not user:
-        raise HTTPException(404, "User not found")
-    return {"id": str(user["_id"]), "username": user.get("username"), "bio": user.get("bio", ""), "avatar": user.get("avatar", ""), "theme": user.get("theme", "system")}
+@app.get("/users/{user_id}", response_model=None)
+async def get_profile(user_id: str):
+    body = await get_cached(("user", user_id))
+    if body is None:
+        user = await user_coll.find_one({"_id": oid(user_id)}, USER_PUBLIC_PROJ)
+        if not user:
+            raise HTTPException(404, "User not found")
+        body = dump_json({"id": str(user["_id"]), "username": user.get("username"), "bio": user.get("bio", ""), "avatar": user.get("avatar", ""), "theme": user.get("theme", "system")})
+        await set_cached(("user", user_id), body)
+    return cached_json(body)
 
 @app.put("/users/{user_id}")
-def update_profile(user_id: str, data: dict):
-    db["user"].update_one({"_id": oid(user_id)}, {"$set": data, "$currentDate": {"updated_at": True}})
-    user = db["user"].find_one({"_id": oid(user_id)})
+async def update_profile(user_id: str, data: dict):
+    data = {k: v for k, v in data.items() if k not in PROTECTED_USER_FIELDS}
+    update = {"$currentDate": TOUCH_UPDATED_AT}
+    if data:
+        update["$set"] = data
+    user = await user_coll.find_one_and_update(
+        {"_id": oid(user_id)},
+        update,
+        projection=WITHOUT_PASSWORD,
+        return_document=ReturnDocument.AFTER,
+    )
+    await invalidate("user", user_id)
     return with_id(user)
 
 # ------------- Forum -------------
 @app.post("/forum")
-def create_forum_post(post: ForumPost):
-    new_id = create_document("forumpost", post)
+async def create_forum_post(post: ForumPost):
+    new_id = await create_document("forumpost", post)
+    await invalidate("forumpost")
     return {"id": new_id}
 
-@app.get("/forum")
-def list_forum_posts(limit: int = 20):
-    posts = get_documents("forumpost", {}, limit)
-    return [with_id(p) for p in posts]
+@app.get("/forum", response_model=None, responses={200: {"model": List[ForumPostOut]}})
+async def list_forum_posts(request: Request, limit: int = Query(20, ge=1, le=MAX_LIST_LIMIT)):
+    return await cached_list(request, "forumpost", limit)
 
 @app.post("/forum/{post_id}/comment")
-def comment_forum_post(post_id: str, comment: CommentAction):
+async def comment_forum_post(post_id: str, comment: CommentAction):
     data = ForumComment(user_id=comment.user_id, post_id=post_id, content=comment.content)
-    new_id = create_document("forumcomment", data)
+    new_id = await create_document("forumcomment", data)
     return {"id": new_id}
 
 @app.post("/forum/{post_id}/like")
-def like_forum_post(post_id: str, like: LikeAction):
-    db["forumpost"].update_one({"_id": oid(post_id)}, {"$inc": {"likes": 1}, "$currentDate": {"updated_at": True}})
-    post = db["forumpost"].find_one({"_id": oid(post_id)})
+async def like_forum_post(post_id: str, like: LikeAction):
+    _id = oid(post_id)
+    post = await forumpost_coll.find_one({"_id": _id})
+    if post:
+        # likes are written behind; report stored count + buffered likes
+        post["likes"] = post.get("likes", 0) + add_like("forumpost", _id)
     return with_id(post)
 
 # ------------- News -------------
 @app.post("/news")
-def create_news(news: News):
-    new_id = create_document("news", news)
+async def create_news(news: News):
+    new_id = await create_document("news", news)
+    await invalidate("news")
     return {"id": new_id}
 
-@app.get("/news")
-def list_news(limit: int = 20):
-    items = get_documents("news", {}, limit)
-    return [with_id(n) for n in items]
+@app.get("/news", response_model=None, responses={200: {"model": List[NewsOut]}})
+async def list_news(request: Request, limit: int = Query(20, ge=1, le=MAX_LIST_LIMIT)):
+    return await cached_list(request, "news", limit)
 
 @app.post("/news/{news_id}/comment")
-def comment_news(news_id: str, comment: CommentAction):
+async def comment_news(news_id: str, comment: CommentAction):
     data = NewsComment(user_id=comment.user_id, news_id=news_id, content=comment.content)
-    new_id = create_document("newscomment", data)
+    new_id = await create_document("newscomment", data)
     return {"id": new_id}
 
 @app.post("/news/{news_id}/like")
-def like_news(news_id: str, like: LikeAction):
-    db["news"].update_one({"_id": oid(news_id)}, {"$inc": {"likes": 1}, "$currentDate": {"updated_at": True}})
-    item = db["news"].find_one({"_id": oid(news_id)})
+async def like_news(news_id: str, like: LikeAction):
+    _id = oid(news_id)
+    item = await news_coll.find_one({"_id": _id})
+    if item:
+        item["likes"] = item.get("likes", 0) + add_like("news", _id)
     return with_id(item)
 
 # ------------- Gallery -------------
 @app.post("/gallery")
-def upload_image(img: GalleryImage):
-    new_id = create_document("galleryimage", img)
+async def upload_image(img: GalleryImage):
+    new_id = await create_document("galleryimage", img)
+    await invalidate("galleryimage")
     return {"id": new_id}
 
-@app.get("/gallery")
-def list_images(limit: int = 30):
-    items = get_documents("galleryimage", {}, limit)
-    return [with_id(i) for i in items]
+@app.get("/gallery", response_model=None, responses={200: {"model": List[GalleryImageSummary]}})
+async def list_images(request: Request, limit: int = Query(30, ge=1, le=MAX_LIST_LIMIT)):
+    return await cached_list(request, "galleryimage", limit, WITHOUT_IMAGE_DATA)
+
+@app.get("/gallery/{image_id}", response_model=None, responses={200: {"model": GalleryImageOut}})
+async def get_image(image_id: str):
+    _id = oid(image_id)
+    item = await galleryimage_coll.find_one({"_id": _id})
+    if not item:
+        raise HTTPException(404, "Image not found")
+    item["likes"] = item.get("likes", 0) + pending_likes("galleryimage", _id)
+    return MongoJSONResponse(with_id(item))
 
 @app.post("/gallery/{image_id}/like")
-def like_image(image_id: str, like: LikeAction):
-    db["galleryimage"].update_one({"_id": oid(image_id)}, {"$inc": {"likes": 1}, "$currentDate": {"updated_at": True}})
-    item = db["galleryimage"].find_one({"_id": oid(image_id)})
+async def like_image(image_id: str, like: LikeAction):
+    _id = oid(image_id)
+    item = await galleryimage_coll.find_one({"_id": _id}, WITHOUT_IMAGE_DATA)
+    if item:
+        item["likes"] = item.get("likes", 0) + add_like("galleryimage", _id)
     return with_id(item)
 
 # ------------- Shop -------------
 @app.post("/products")
-def create_product(product: Product):
-    new_id = create_document("product", product)
+async def create_product(product: Product):
+    new_id = await create_document("product", product)
+    await invalidate("product")
     return {"id": new_id}
 
-@app.get("/products")
-def list_products(limit: int = 20):
-    items = get_documents("product", {}, limit)
-    return [with_id(p) for p in items]
+@app.get("/products", response_model=None, responses={200: {"model": List[ProductOut]}})
+async def list_products(request: Request, limit: int = Query(20, ge=1, le=MAX_LIST_LIMIT)):
+    return await cached_list(request, "product", limit)
 
 @app.post("/orders")
-def create_order(order: Order):
-    # simple stock check
-    total = 0.0
+async def create_order(order: Order):
+    # stock check and total computed by Mongo in a single aggregation round trip
+    quantities = {}
     for item in order.items:
-        product = db["product"].find_one({"_id": oid(item["product_id"])})
-        if not product:
-            raise HTTPException(404, f"Product {item['product_id']} not found")
-        if product.get("stock", 0) < item.get("quantity", 1):
-            raise HTTPException(400, f"Insufficient stock for {product['title']}")
-        total += product.get("price", 0) * item.get("quantity", 1)
+        _id = oid(item["product_id"])
+        quantities[_id] = quantities.get(_id, 0) + item.get("quantity", 1)
+    ids = list(quantities)
+    pipeline = [
+        {"$match": {"_id": {"$in": ids}}},
+        {"$project": {
+            "title": 1,
+            "price": {"$ifNull": ["$price", 0]},
+            "stock": {"$ifNull": ["$stock", 0]},
+            "quantity": {"$arrayElemAt": [list(quantities.values()), {"$indexOfArray": [ids, "$_id"]}]},
+        }},
+        {"$facet": {
+            "found": [{"$project": {"_id": 1}}],
+            "short": [{"$match": {"$expr": {"$lt": ["$stock", "$quantity"]}}}, {"$project": {"title": 1}}, {"$limit": 1}],
+            "total": [{"$group": {"_id": None, "total": {"$sum": {"$multiply": ["$price", "$quantity"]}}}}],
+        }},
+    ]
+    result = (await product_coll.aggregate(pipeline).to_list(1))[0]
+    found = {p["_id"] for p in result["found"]}
+    missing = [_id for _id in ids if _id not in found]
+    if missing:
+        raise HTTPException(404, f"Product {missing[0]} not found")
+    if result["short"]:
+        raise HTTPException(400, f"Insufficient stock for {result['short'][0]['title']}")
+    total = float(result["total"][0]["total"]) if result["total"] else 0.0
     order.total = total
-    new_id = create_document("order", order)
+    new_id = await create_document("order", order)
     return {"id": new_id, "total": total}
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.getenv("WEB_CONCURRENCY", 2 * (os.cpu_count() or 1) + 1))
+    # workers > 1 needs the import string; loop/http default to "auto", which
+    # picks uvloop/httptools when uvicorn[standard] is installed
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        log_level=os.getenv("LOG_LEVEL", "warning"),
+    )
@@ -7,11 +7,16 @@ name is the lowercase of the class name (e.g., User -> "user").
 These models are used for validation on create/update in the API.
 """
 from typing import List, Optional
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, EmailStr
 from datetime import datetime
 
+
+class Schema(BaseModel):
+    # Validators/serializers are built on first use instead of at import
+    model_config = ConfigDict(defer_build=True)
+
 # ------------ Users ------------
-class User(BaseModel):
+class User(Schema):
     username: str = Field(..., min_length=3, max_length=24)
     email: EmailStr
     password_hash: str
@@ -19,68 +24,99 @@ class User(BaseModel):
     avatar: Optional[str] = ""  # URL or base64 data URL
     theme: Optional[str] = Field("system", description="light|dark|system")
 
-class PublicUser(BaseModel):
+class PublicUser(Schema):
     id: str
     username: str
     avatar: Optional[str] = ""
     bio: Optional[str] = ""
 
 # ------------ Forum ------------
-class ForumPost(BaseModel):
+class ForumPost(Schema):
     user_id: str
     title: str
     content: str
     tags: List[str] = []
     likes: int = 0
 
-class ForumComment(BaseModel):
+class ForumComment(Schema):
     user_id: str
     post_id: str
     content: str
 
 # ------------ Gallery ------------
-class GalleryImage(BaseModel):
+class GalleryImage(Schema):
     user_id: str
     caption: Optional[str] = ""
     image_base64: str  # data URL (e.g., "data:image/png;base64,....")
     likes: int = 0
 
 # ------------ Shop ------------
-class Product(BaseModel):
+class Product(Schema):
     title: str
     description: Optional[str] = ""
     price: float
     image: Optional[str] = ""  # URL or base64
     stock: int = 0
 
-class Order(BaseModel):
+class Order(Schema):
     user_id: str
     items: List[dict]  # [{product_id, quantity}]
     total: float
     status: str = "pending"
 
 # ------------ News ------------
-class News(BaseModel):
+class News(Schema):
     title: str
     content: str
     image: Optional[str] = ""
     likes: int = 0
 
-class NewsComment(BaseModel):
+class NewsComment(Schema):
     user_id: str
     news_id: str
     content: str
 
 # Utility models for likes/comments
-class LikeAction(BaseModel):
+class LikeAction(Schema):
     user_id: str
 
-class CommentAction(BaseModel):
+class CommentAction(Schema):
     user_id: str
     content: str
 
 # Response helpers
-class CreatedResponse(BaseModel):
+class CreatedResponse(Schema):
     id: str
     created_at: datetime
     updated_at: datetime
+
+# Read models for the GET endpoints. They only document responses in OpenAPI
+# (via responses=); endpoints return pre-serialized JSON and never build them.
+class ForumPostOut(ForumPost):
+    id: str
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class NewsOut(News):
+    id: str
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class GalleryImageOut(GalleryImage):
+    id: str
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class GalleryImageSummary(Schema):
+    # gallery listing entry; fetch /gallery/{id} for image_base64
+    id: str
+    user_id: str
+    caption: Optional[str] = ""
+    likes: int = 0
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class ProductOut(Product):
+    id: str
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+import main
+
+
+class FakeUsers:
+    def __init__(self, *docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.updates = []
+
+    async def find_one(self, filter, projection=None):
+        for doc in self.docs.values():
+            if all(doc.get(k) == v for k, v in filter.items()):
+                return dict(doc)
+        return None
+
+    async def update_one(self, filter, update):
+        self.updates.append(update)
+        self.docs[filter["_id"]].update(update.get("$set", {}))
+
+    async def find_one_and_update(self, filter, update, projection=None, return_document=None):
+        self.updates.append(update)
+        doc = self.docs[filter["_id"]]
+        doc.update(update.get("$set", {}))
+        return {k: v for k, v in doc.items() if k != "password_hash"}
+
+
+def make_user(password_hash):
+    return {"_id": ObjectId(), "username": "reader", "email": "a@example.com", "password_hash": password_hash}
+
+
+def login(password):
+    return asyncio.run(main.login(main.LoginPayload(email="a@example.com", password=password)))
+
+
+def test_plaintext_password_is_migrated_on_login(monkeypatch):
+    user = make_user("hunter2")
+    users = FakeUsers(user)
+    monkeypatch.setattr(main, "user_coll", users)
+
+    assert login("hunter2")["id"] == str(user["_id"])
+
+    stored = users.docs[user["_id"]]["password_hash"]
+    assert stored.startswith("$argon2id$")
+    assert main.ph.verify(stored, "hunter2")
+
+
+def test_argon2_password_logs_in_without_rehash(monkeypatch):
+    users = FakeUsers(make_user(main.ph.hash("hunter2")))
+    monkeypatch.setattr(main, "user_coll", users)
+
+    login("hunter2")
+
+    assert users.updates == []
+
+
+@pytest.mark.parametrize("stored", ["hunter2", main.ph.hash("hunter2")])
+def test_wrong_password_is_rejected(monkeypatch, stored):
+    users = FakeUsers(make_user(stored))
+    monkeypatch.setattr(main, "user_coll", users)
+
+    with pytest.raises(HTTPException) as exc:
+        login("wrong")
+
+    assert exc.value.status_code == 401
+    assert users.updates == []
+
+
+def test_update_profile_ignores_protected_fields(monkeypatch):
+    user = make_user(main.ph.hash("hunter2"))
+    users = FakeUsers(user)
+    monkeypatch.setattr(main, "user_coll", users)
+
+    data = {"bio": "hi", "password_hash": "plain", "email": "b@example.com", "_id": "x"}
+    asyncio.run(main.update_profile(str(user["_id"]), data))
+
+    assert users.updates[0]["$set"] == {"bio": "hi"}
+    assert users.docs[user["_id"]]["email"] == "a@example.com"
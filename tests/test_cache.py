@@ -0,0 +1,54 @@
+import asyncio
+
+import fakeredis.aioredis
+import pytest
+from cachetools import TTLCache
+
+import cache
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(cache, "_redis", fake)
+    monkeypatch.setattr(cache, "_cache", TTLCache(maxsize=256, ttl=cache.CACHE_TTL_SECONDS))
+    return fake
+
+
+def test_local_miss_falls_back_to_redis(redis):
+    async def run():
+        await cache.set_cached(("user", "a"), b"{}")
+        cache._cache.clear()
+        return await cache.get_cached(("user", "a"))
+
+    assert asyncio.run(run()) == b"{}"
+    assert cache._cache[("user", "a")] == b"{}"
+
+
+def test_namespace_invalidation_drops_indexed_entries(redis):
+    async def run():
+        await cache.set_cached(("forumpost", 10), b"[1]", indexed=True)
+        await cache.set_cached(("forumpost", 20), b"[2]", indexed=True)
+        await cache.set_cached(("news", 10), b"[3]", indexed=True)
+        await cache.invalidate("forumpost")
+        cache._cache.clear()
+        return (
+            await cache.get_cached(("forumpost", 10)),
+            await cache.get_cached(("forumpost", 20)),
+            await cache.get_cached(("news", 10)),
+            await redis.exists("cache-keys:forumpost"),
+        )
+
+    assert asyncio.run(run()) == (None, None, b"[3]", 0)
+
+
+def test_per_key_entries_do_not_grow_the_index(redis):
+    async def run():
+        for i in range(100):
+            await cache.set_cached(("user", i), b"{}")
+            await cache.invalidate("user", i)
+        await cache.set_cached(("forumpost", 10), b"[]", indexed=True)
+        await cache.invalidate("forumpost", 10)
+        return await redis.scard("cache-keys:user"), await redis.scard("cache-keys:forumpost"), await redis.dbsize()
+
+    assert asyncio.run(run()) == (0, 0, 0)
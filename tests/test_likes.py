@@ -0,0 +1,116 @@
+import asyncio
+from collections import defaultdict
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import likes
+
+
+class FakeCollection:
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    async def bulk_write(self, ops, ordered=True):
+        self.calls.append(ops)
+        if self.error is not None:
+            raise self.error
+
+
+class FakeDB(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(likes, "db", fake)
+    monkeypatch.setattr(likes, "_pending", defaultdict(int))
+    monkeypatch.setattr(likes, "_flush_task", None)
+    monkeypatch.setattr(likes, "_stop_event", None)
+    return fake
+
+
+def inc_by_id(ops):
+    return {op._filter["_id"]: op._doc["$inc"]["likes"] for op in ops}
+
+
+def test_likes_are_aggregated_per_document(db):
+    assert [likes.add_like("forumpost", "a") for _ in range(3)] == [1, 2, 3]
+    likes.add_like("forumpost", "b")
+    likes.add_like("news", "a")
+
+    asyncio.run(likes.flush_likes())
+
+    assert len(db["forumpost"].calls) == 1
+    assert inc_by_id(db["forumpost"].calls[0]) == {"a": 3, "b": 1}
+    assert inc_by_id(db["news"].calls[0]) == {"a": 1}
+    assert likes.pending_likes("forumpost", "a") == 0
+
+
+def test_stop_flushes_remaining_likes(db):
+    async def run():
+        likes.start_like_flusher()
+        likes.add_like("galleryimage", "a")
+        likes.add_like("galleryimage", "a")
+        await likes.stop_like_flusher()
+
+    asyncio.run(run())
+
+    assert inc_by_id(db["galleryimage"].calls[0]) == {"a": 2}
+    assert likes._flush_task is None
+    assert likes.pending_likes("galleryimage", "a") == 0
+
+
+def test_stop_waits_for_in_flight_flush(db, monkeypatch):
+    flushing = asyncio.Event()
+
+    class SlowCollection(FakeCollection):
+        async def bulk_write(self, ops, ordered=True):
+            flushing.set()
+            await asyncio.sleep(0.05)
+            await super().bulk_write(ops, ordered)
+
+    db["forumpost"] = SlowCollection()
+    db["news"] = SlowCollection()
+    monkeypatch.setattr(likes, "FLUSH_INTERVAL_SECONDS", 0.01)
+
+    async def run():
+        likes.start_like_flusher()
+        likes.add_like("forumpost", "a")
+        likes.add_like("news", "b")
+        await flushing.wait()
+        await likes.stop_like_flusher()
+
+    asyncio.run(run())
+
+    assert inc_by_id(db["forumpost"].calls[0]) == {"a": 1}
+    assert inc_by_id(db["news"].calls[0]) == {"b": 1}
+    assert likes.pending_likes("forumpost", "a") == 0
+    assert likes.pending_likes("news", "b") == 0
+
+
+def test_bulk_write_error_requeues_only_failed_ops(db):
+    db["forumpost"] = FakeCollection(BulkWriteError({"writeErrors": [{"index": 1, "code": 1, "errmsg": "boom"}]}))
+    likes.add_like("forumpost", "a")
+    likes.add_like("forumpost", "b")
+    likes.add_like("forumpost", "b")
+
+    asyncio.run(likes.flush_likes())
+
+    assert likes.pending_likes("forumpost", "a") == 0
+    assert likes.pending_likes("forumpost", "b") == 2
+
+
+def test_connection_error_requeues_collection(db):
+    db["news"] = FakeCollection(AutoReconnect("down"))
+    likes.add_like("news", "a")
+    likes.add_like("forumpost", "b")
+
+    asyncio.run(likes.flush_likes())
+
+    assert likes.pending_likes("news", "a") == 1
+    assert likes.pending_likes("forumpost", "b") == 0